@@ -0,0 +1,139 @@
+# bench_memory.py
+#
+# Compare peak Python memory of the in-memory merge (merge_csv_files + insert_csv_to_db)
+# against the chunked pipeline (sorted runs + k-way merge + streamed inserts).
+# Uses synthetic page CSVs, so no LlamaParse calls are made.
+#
+# Usage: python bench_memory.py [pages ...]
+
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+from chunked_processing import DEFAULT_PAGES_PER_CHUNK, RUN_COLUMNS, write_sorted_run, iter_merged_runs
+from database_utils import insert_csv_to_db, insert_rows_to_db
+
+ROWS_PER_PAGE = 40
+
+# Same layout as the orders table in garment_orders.db before any migration
+ORDERS_SCHEMA_SQL = """
+CREATE TABLE orders (
+    Id INTEGER PRIMARY KEY AUTOINCREMENT,
+    OrderNumber TEXT NOT NULL,
+    StyleCode TEXT NOT NULL,
+    Description TEXT,
+    ColorCode TEXT NOT NULL,
+    ColorName TEXT,
+    Quantity INTEGER NOT NULL,
+    Price REAL,
+    Total REAL,
+    Fabric TEXT,
+    Composition TEXT,
+    SizeXS INTEGER,
+    SizeS INTEGER,
+    SizeM INTEGER,
+    SizeL INTEGER,
+    SizeXL INTEGER,
+    SizeXXL INTEGER,
+    IssueDate DATE,
+    PickupDate DATE,
+    OwnershipDate DATE,
+    Season TEXT,
+    Line INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(OrderNumber, StyleCode, ColorCode, Quantity)
+)
+"""
+
+
+def make_page_csvs(folder, pages):
+    """Write one synthetic CSV per page, with Line numbers shuffled across pages"""
+    lines = list(range(1, pages * ROWS_PER_PAGE + 1))
+    random.Random(42).shuffle(lines)
+
+    for page_num in range(pages):
+        page_lines = lines[page_num * ROWS_PER_PAGE:(page_num + 1) * ROWS_PER_PAGE]
+        rows = []
+        for line in page_lines:
+            quantity = 100 + line
+            rows.append({
+                'OrderNumber': 'PO-BENCH', 'StyleCode': f"ST{line % 500:04d}",
+                'Description': 'Long sleeve crew neck t-shirt', 'ColorCode': f"C{line:06d}",
+                'ColorName': 'Navy Blue', 'Quantity': quantity, 'Price': 4.25, 'Total': quantity * 4.25,
+                'Fabric': 'Single Jersey', 'Composition': '100% Cotton',
+                'SizeXS': 10, 'SizeS': 20, 'SizeM': 30, 'SizeL': 20, 'SizeXL': 10, 'SizeXXL': quantity - 90,
+                'IssueDate': '2024-11-01', 'PickupDate': '2025-01-15', 'OwnershipDate': '2025-01-20',
+                'Season': 'SS25', 'Line': line,
+            })
+        pd.DataFrame(rows, columns=RUN_COLUMNS).to_csv(os.path.join(folder, f"po_{page_num + 1}.csv"), index=False)
+
+
+def make_db(db_file):
+    """Create an empty database with the original orders table"""
+    with sqlite3.connect(db_file) as conn:
+        conn.execute(ORDERS_SCHEMA_SQL)
+
+
+def run_in_memory(csv_folder, work_dir, db_file):
+    from update import merge_csv_files  # already imported by main(), so not traced
+    merged_csv = os.path.join(work_dir, "merged.csv")
+    merge_csv_files(csv_folder, merged_csv)
+    insert_csv_to_db(db_file, merged_csv)
+
+
+def run_chunked(csv_folder, work_dir, db_file):
+    csv_files = sorted(
+        (f for f in os.listdir(csv_folder) if f.endswith('.csv')),
+        key=lambda f: int(f[len("po_"):-len(".csv")])
+    )
+    run_paths = []
+    for start in range(0, len(csv_files), DEFAULT_PAGES_PER_CHUNK):
+        chunk = [os.path.join(csv_folder, f) for f in csv_files[start:start + DEFAULT_PAGES_PER_CHUNK]]
+        run_path = os.path.join(work_dir, f"run_{len(run_paths) + 1}.csv")
+        if write_sorted_run(chunk, run_path):
+            run_paths.append(run_path)
+    insert_rows_to_db(db_file, iter_merged_runs(run_paths))
+
+
+def measure(func, pages):
+    """Run func on a fresh set of synthetic pages and return (peak MiB, seconds)"""
+    temp_dir = tempfile.mkdtemp()
+    try:
+        csv_folder = os.path.join(temp_dir, "pages")
+        os.makedirs(csv_folder)
+        make_page_csvs(csv_folder, pages)
+        db_file = os.path.join(temp_dir, "bench.db")
+        make_db(db_file)
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        func(csv_folder, temp_dir, db_file)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak / (1024 * 1024), elapsed
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def main():
+    page_counts = [int(arg) for arg in sys.argv[1:]] or [100, 400, 1000]
+
+    # Import the app (streamlit, llama_parse) before tracing starts so the
+    # in-memory peak only reflects merge_csv_files and insert_csv_to_db
+    import update  # noqa: F401
+
+    print(f"{'pages':>6} {'mode':>10} {'peak MiB':>10} {'seconds':>9}")
+    for pages in page_counts:
+        for name, func in (("in-memory", run_in_memory), ("chunked", run_chunked)):
+            peak, elapsed = measure(func, pages)
+            print(f"{pages:>6} {name:>10} {peak:>10.1f} {elapsed:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
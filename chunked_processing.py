@@ -0,0 +1,97 @@
+import csv
+import heapq
+import math
+import pandas as pd
+
+# Number of parsed pages converted and sorted together in chunked mode
+DEFAULT_PAGES_PER_CHUNK = 25
+
+NUMERIC_COLUMNS = ['Quantity', 'Price', 'Total', 'SizeXS', 'SizeS', 'SizeM',
+                   'SizeL', 'SizeXL', 'SizeXXL']
+
+RUN_COLUMNS = [
+    'OrderNumber', 'StyleCode', 'Description', 'ColorCode', 'ColorName',
+    'Quantity', 'Price', 'Total', 'Fabric', 'Composition',
+    'SizeXS', 'SizeS', 'SizeM', 'SizeL', 'SizeXL', 'SizeXXL',
+    'IssueDate', 'PickupDate', 'OwnershipDate', 'Season', 'Line'
+]
+
+# Order-level fields that merge_csv_files copies from the first row to every row
+HEADER_COLUMNS = ['IssueDate', 'PickupDate', 'OwnershipDate', 'Season', 'OrderNumber']
+
+
+def write_sorted_run(csv_paths, run_path):
+    """
+    Clean the page CSVs of one chunk, sort them by Line and write them as a run file.
+
+    Applies the same row filtering as merge_csv_files, but only ever holds one
+    chunk of pages in memory.
+
+    Parameters:
+    csv_paths (list): Paths to the page CSV files belonging to this chunk.
+    run_path (str): Path where the sorted run will be written.
+
+    Returns:
+    int: Number of rows written to the run.
+    """
+    dfs = []
+    for csv_path in csv_paths:
+        try:
+            df = pd.read_csv(csv_path)
+            for col in NUMERIC_COLUMNS:
+                if col in df.columns:
+                    df[col] = pd.to_numeric(df[col], errors='coerce')
+            dfs.append(df)
+        except Exception as e:
+            print(f"Error processing {csv_path}: {str(e)}")
+
+    if not dfs:
+        return 0
+
+    chunk_df = pd.concat(dfs, ignore_index=True)
+    del dfs
+
+    chunk_df = chunk_df[~chunk_df.apply(lambda row: row.astype(str).str.contains('---').any(), axis=1)]
+    chunk_df = chunk_df.reindex(columns=RUN_COLUMNS)
+    chunk_df['Line'] = pd.to_numeric(chunk_df['Line'], errors='coerce')
+    chunk_df = chunk_df.dropna(subset=['StyleCode', 'Line'], how='all')
+    chunk_df = chunk_df.sort_values(by='Line', ascending=True, kind='stable')
+
+    chunk_df.to_csv(run_path, index=False)
+    return len(chunk_df)
+
+
+def _line_key(row):
+    """Sort key for a run row; rows without a Line go last, as in pandas."""
+    try:
+        value = float(row['Line'])
+    except (TypeError, ValueError):
+        return math.inf
+    return math.inf if math.isnan(value) else value
+
+
+def _read_run(run_path):
+    with open(run_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yield {col: (value if value != '' else None) for col, value in row.items()}
+
+
+def iter_merged_runs(run_paths):
+    """
+    K-way merge sorted run files by Line, yielding one row dict at a time.
+
+    The order-level fields of the first merged row are copied to every row,
+    matching the behaviour of merge_csv_files.
+
+    Parameters:
+    run_paths (list): Paths to run files written by write_sorted_run.
+
+    Yields:
+    dict: A row keyed by the orders table column names.
+    """
+    header = None
+    for row in heapq.merge(*(_read_run(path) for path in run_paths), key=_line_key):
+        if header is None:
+            header = {col: row[col] for col in HEADER_COLUMNS}
+        row.update(header)
+        yield row
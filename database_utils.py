@@ -1,15 +1,254 @@
+import hashlib
+import json
 import os
+import re
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
 import pandas as pd
+from profiling import profiled
 
-def insert_csv_to_db(db_file, csv_file):
+# Search result cache settings
+QUERY_CACHE_TTL_SECONDS = 300
+QUERY_CACHE_MAX_ENTRIES = 64
+
+# Rows per executemany() batch when streaming rows into the database
+INSERT_BATCH_SIZE = 500
+
+UPSERT_ORDER_SQL = """
+INSERT INTO orders (
+    OrderNumber, StyleCode, Description, ColorCode, ColorName,
+    Quantity, Price, Total, Fabric, Composition,
+    SizeXS, SizeS, SizeM, SizeL, SizeXL, SizeXXL,
+    IssueDate, PickupDate, OwnershipDate, Season, Line
+)
+VALUES (
+    :OrderNumber, :StyleCode, :Description, :ColorCode, :ColorName,
+    :Quantity, :Price, :Total, :Fabric, :Composition,
+    :SizeXS, :SizeS, :SizeM, :SizeL, :SizeXL, :SizeXXL,
+    :IssueDate, :PickupDate, :OwnershipDate, :Season, :Line
+)
+ON CONFLICT(OrderNumber, StyleCode, ColorCode, Quantity)
+DO UPDATE SET
+    Price=excluded.Price,
+    Total=excluded.Total,
+    ColorName=excluded.ColorName,
+    Fabric=excluded.Fabric,
+    Season=excluded.Season;
+"""
+
+# Columns written for every order line, in table order
+ORDER_COLUMNS = [
+    'OrderNumber', 'StyleCode', 'Description', 'ColorCode', 'ColorName',
+    'Quantity', 'Price', 'Total', 'Fabric', 'Composition',
+    'SizeXS', 'SizeS', 'SizeM', 'SizeL', 'SizeXL', 'SizeXXL',
+    'IssueDate', 'PickupDate', 'OwnershipDate', 'Season', 'Line'
+]
+
+# Key columns declared NOT NULL in the orders table
+REQUIRED_ORDER_COLUMNS = ['OrderNumber', 'StyleCode', 'ColorCode', 'Quantity']
+
+# One row per ingested document; RowSetHash identifies the rows it produced
+INGEST_LEDGER_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS ingest_ledger (
+    Fingerprint TEXT PRIMARY KEY,
+    OrderNumber TEXT NOT NULL,
+    RowSetHash TEXT NOT NULL,
+    RowCount INTEGER NOT NULL,
+    ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+# Dictionary tables of the optional normalized schema:
+# table -> (foreign key column in orders_compact, attribute columns)
+DIMENSION_TABLES = {
+    'styles': ('StyleId', ['Description']),
+    'colors': ('ColorId', ['ColorName']),
+    'fabrics': ('FabricId', ['Fabric', 'Composition']),
+    'seasons': ('SeasonId', ['Season']),
+}
+
+COMPACT_ORDERS_SCHEMA_SQL = """
+CREATE TABLE orders_compact (
+    Id INTEGER PRIMARY KEY AUTOINCREMENT,
+    OrderNumber TEXT NOT NULL,
+    StyleCode TEXT NOT NULL,
+    StyleId INTEGER REFERENCES styles(Id),
+    ColorCode TEXT NOT NULL,
+    ColorId INTEGER REFERENCES colors(Id),
+    Quantity INTEGER NOT NULL,
+    Price REAL,
+    Total REAL,
+    FabricId INTEGER REFERENCES fabrics(Id),
+    SizeXS INTEGER,
+    SizeS INTEGER,
+    SizeM INTEGER,
+    SizeL INTEGER,
+    SizeXL INTEGER,
+    SizeXXL INTEGER,
+    IssueDate DATE,
+    PickupDate DATE,
+    OwnershipDate DATE,
+    SeasonId INTEGER REFERENCES seasons(Id),
+    Line INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(OrderNumber, StyleCode, ColorCode, Quantity)
+)
+"""
+
+# Presents orders_compact with exactly the columns of the original orders table
+ORDERS_VIEW_SQL = """
+CREATE VIEW orders AS
+SELECT
+    o.Id, o.OrderNumber, o.StyleCode, s.Description, o.ColorCode, c.ColorName,
+    o.Quantity, o.Price, o.Total, f.Fabric, f.Composition,
+    o.SizeXS, o.SizeS, o.SizeM, o.SizeL, o.SizeXL, o.SizeXXL,
+    o.IssueDate, o.PickupDate, o.OwnershipDate, se.Season, o.Line, o.created_at
+FROM orders_compact o
+LEFT JOIN styles s ON s.Id = o.StyleId
+LEFT JOIN colors c ON c.Id = o.ColorId
+LEFT JOIN fabrics f ON f.Id = o.FabricId
+LEFT JOIN seasons se ON se.Id = o.SeasonId
+"""
+
+# Unlike UPSERT_ORDER_SQL, which updates Fabric but keeps the old Composition,
+# a conflict here replaces both: they share one fabrics row, so FabricId moves
+# to the incoming (Fabric, Composition) pair.
+UPSERT_COMPACT_ORDER_SQL = """
+INSERT INTO orders_compact (
+    OrderNumber, StyleCode, StyleId, ColorCode, ColorId,
+    Quantity, Price, Total, FabricId,
+    SizeXS, SizeS, SizeM, SizeL, SizeXL, SizeXXL,
+    IssueDate, PickupDate, OwnershipDate, SeasonId, Line
+)
+VALUES (
+    :OrderNumber, :StyleCode, :StyleId, :ColorCode, :ColorId,
+    :Quantity, :Price, :Total, :FabricId,
+    :SizeXS, :SizeS, :SizeM, :SizeL, :SizeXL, :SizeXXL,
+    :IssueDate, :PickupDate, :OwnershipDate, :SeasonId, :Line
+)
+ON CONFLICT(OrderNumber, StyleCode, ColorCode, Quantity)
+DO UPDATE SET
+    Price=excluded.Price,
+    Total=excluded.Total,
+    ColorId=excluded.ColorId,
+    FabricId=excluded.FabricId,
+    SeasonId=excluded.SeasonId;
+"""
+
+# (db_file, table) -> {attribute values: Id}, so ingest skips a lookup per row.
+# Only ids from committed transactions are added, see _publish_dimension_ids().
+_dimension_id_cache = {}
+
+# Incremented on every committed write to the orders table
+_table_version = 0
+
+# (db_file, normalized query, params) -> (stored_at, table_version, DataFrame)
+_query_cache = OrderedDict()
+_query_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+# Streamlit sessions share the cache from their own threads
+_query_cache_lock = threading.Lock()
+
+
+def bump_table_version():
+    """Mark the orders table as changed and drop every cached search result."""
+    global _table_version
+    with _query_cache_lock:
+        _table_version += 1
+        _query_cache.clear()
+
+
+def _normalize_query(query):
+    """Collapse whitespace so formatting differences map to the same cache key."""
+    return re.sub(r'\s+', ' ', query).strip()
+
+
+@profiled
+def cached_read_sql(db_file, query, params=()):
+    """
+    Run a read-only query against the SQLite database, reusing a cached result
+    when the same query and parameters were executed recently.
+
+    Entries expire after QUERY_CACHE_TTL_SECONDS, the least recently used entry
+    is evicted once QUERY_CACHE_MAX_ENTRIES is reached, and all entries are
+    invalidated whenever the table version changes.
+
+    Parameters:
+    db_file (str): Path to the SQLite database file.
+    query (str): SQL SELECT statement.
+    params (sequence): Query parameters.
+
+    Returns:
+    pd.DataFrame: The query result. Callers must not modify it in place.
+    """
+    key = (db_file, _normalize_query(query), tuple(params))
+    now = time.monotonic()
+
+    with _query_cache_lock:
+        # Read before querying, so a commit during the query leaves the result stale
+        current_version = _table_version
+
+        entry = _query_cache.get(key)
+        if entry is not None:
+            stored_at, version, results = entry
+            if version == current_version and now - stored_at < QUERY_CACHE_TTL_SECONDS:
+                _query_cache.move_to_end(key)
+                _query_cache_stats['hits'] += 1
+                return results
+            del _query_cache[key]
+
+        _query_cache_stats['misses'] += 1
+
+    # Query outside the lock so other sessions are not blocked on SQLite
+    with sqlite3.connect(db_file) as conn:
+        results = pd.read_sql_query(query, conn, params=list(params))
+
+    with _query_cache_lock:
+        _query_cache[key] = (now, current_version, results)
+        while len(_query_cache) > QUERY_CACHE_MAX_ENTRIES:
+            _query_cache.popitem(last=False)
+            _query_cache_stats['evictions'] += 1
+
+    return results
+
+
+def get_query_cache_stats():
+    """Return hit/miss counters, hit rate and current size of the search cache."""
+    with _query_cache_lock:
+        lookups = _query_cache_stats['hits'] + _query_cache_stats['misses']
+        return {
+            **_query_cache_stats,
+            'entries': len(_query_cache),
+            'hit_rate': _query_cache_stats['hits'] / lookups if lookups else 0.0,
+            'table_version': _table_version,
+        }
+
+
+@profiled
+def insert_csv_to_db(db_file, csv_file, fingerprint=None):
     """
     Insert data from a CSV file into the SQLite database.
 
+    Without a fingerprint every row is upserted individually. With a
+    fingerprint the document is ingested through the ingest ledger: an
+    identical row set is skipped, otherwise the order's rows are replaced in
+    one transaction.
+
     Parameters:
     db_file (str): Path to the SQLite database file.
     csv_file (str): Path to the CSV file to be inserted.
+    fingerprint (str): Optional document fingerprint from document_fingerprint().
+
+    Returns:
+    str: 'unchanged', 'replaced' or 'inserted' when a fingerprint is given, else None.
+
+    Raises:
+    ValueError, sqlite3.Error: With a fingerprint, if the document could not be
+    saved. Nothing is written in that case.
     """
+    connection = None
     try:
         # Check if the CSV file exists
         if not os.path.exists(csv_file):
@@ -24,41 +263,435 @@ def insert_csv_to_db(db_file, csv_file):
         connection = sqlite3.connect(db_file)
         cursor = connection.cursor()
 
+        if fingerprint is not None:
+            return _replace_document_rows(connection, db_file, df.to_dict('records'), fingerprint)
+
+        upsert_sql, to_params, pending_ids = _order_writer(connection, db_file)
+
         # Insert data into the orders table
         for _, row in df.iterrows():
             try:
-                cursor.execute("""
-                INSERT INTO orders (
-                    OrderNumber, StyleCode, Description, ColorCode, ColorName,
-                    Quantity, Price, Total, Fabric, Composition,
-                    SizeXS, SizeS, SizeM, SizeL, SizeXL, SizeXXL,
-                    IssueDate, PickupDate, OwnershipDate, Season, Line
-                )
-                VALUES (
-                    :OrderNumber, :StyleCode, :Description, :ColorCode, :ColorName,
-                    :Quantity, :Price, :Total, :Fabric, :Composition,
-                    :SizeXS, :SizeS, :SizeM, :SizeL, :SizeXL, :SizeXXL,
-                    :IssueDate, :PickupDate, :OwnershipDate, :Season, :Line
-                )
-                ON CONFLICT(OrderNumber, StyleCode, ColorCode, Quantity)
-                DO UPDATE SET
-                    Price=excluded.Price,
-                    Total=excluded.Total,
-                    ColorName=excluded.ColorName,
-                    Fabric=excluded.Fabric,
-                    Season=excluded.Season;
-                """, row.to_dict())
+                cursor.execute(upsert_sql, to_params(row.to_dict()))
             except sqlite3.Error as e:
                 print(f"Error inserting row: {row['OrderNumber']}, Error: {e}")
         
         # Commit the transaction
         connection.commit()
+        _publish_dimension_ids(pending_ids)
+        bump_table_version()
         print("Data inserted successfully.")
 
     except Exception as e:
+        if fingerprint is not None:
+            raise
         print(f"Unexpected error: {e}")
 
     finally:
         # Close the connection
         if connection:
             connection.close()
+
+
+@profiled
+def insert_rows_to_db(db_file, rows, batch_size=INSERT_BATCH_SIZE, fingerprint=None):
+    """
+    Stream rows into the SQLite database in fixed-size batches.
+
+    Unlike insert_csv_to_db, the rows never have to be held in memory at once,
+    so this is used by the chunked processing mode for very large documents.
+    With a fingerprint, the existing rows of the streamed order are deleted
+    and the document is recorded in the ingest ledger in the same transaction.
+
+    Parameters:
+    db_file (str): Path to the SQLite database file.
+    rows (iterable): Row dicts keyed by the orders table column names.
+    batch_size (int): Number of rows sent per executemany() call.
+    fingerprint (str): Optional document fingerprint from document_fingerprint().
+
+    Returns:
+    int: Number of rows written.
+    """
+    written = 0
+    connection = sqlite3.connect(db_file)
+    try:
+        upsert_sql, to_params, pending_ids = _order_writer(connection, db_file)
+        if fingerprint is not None:
+            ledger = {'order_number': None, 'digest': 0}
+            rows = _replace_streamed_rows(connection, rows, ledger)
+
+        batch = []
+        for row in rows:
+            batch.append(to_params(row))
+            if len(batch) >= batch_size:
+                connection.executemany(upsert_sql, batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            connection.executemany(upsert_sql, batch)
+            written += len(batch)
+
+        if fingerprint is not None and ledger['order_number'] is not None:
+            _record_ingest(connection, fingerprint, ledger['order_number'],
+                           _format_row_set_hash(ledger['digest']), written)
+
+        connection.commit()
+        _publish_dimension_ids(pending_ids)
+        bump_table_version()
+        print(f"Streamed {written} rows into the database.")
+        return written
+
+    except Exception:
+        connection.rollback()
+        raise
+
+    finally:
+        connection.close()
+
+
+def document_fingerprint(data):
+    """Return the SHA-256 fingerprint of an uploaded document's bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _ensure_ingest_ledger(connection):
+    connection.execute(INGEST_LEDGER_SCHEMA_SQL)
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_ingest_ledger_order ON ingest_ledger (OrderNumber)")
+
+
+def find_ingested_document(db_file, fingerprint):
+    """
+    Look up a document fingerprint in the ingest ledger.
+
+    Parameters:
+    db_file (str): Path to the SQLite database file.
+    fingerprint (str): Fingerprint from document_fingerprint().
+
+    Returns:
+    dict: The ledger entry, or None if the document has not been ingested.
+    """
+    with sqlite3.connect(db_file) as connection:
+        connection.row_factory = sqlite3.Row
+        _ensure_ingest_ledger(connection)
+        row = connection.execute(
+            "SELECT * FROM ingest_ledger WHERE Fingerprint = ?", (fingerprint,)
+        ).fetchone()
+    return dict(row) if row is not None else None
+
+
+def _canonical_value(value):
+    """Render a cell the same way whether it came from pandas or a CSV reader."""
+    value = _clean_value(value)
+    if value is None or value == '':
+        return ''
+    try:
+        return repr(float(value))
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def _row_digest(row):
+    """Return a row's SHA-256 digest as an integer."""
+    canonical = json.dumps([_canonical_value(row.get(col)) for col in ORDER_COLUMNS])
+    return int.from_bytes(hashlib.sha256(canonical.encode('utf-8')).digest(), 'big')
+
+
+def _format_row_set_hash(digest):
+    return f"{digest % (1 << 256):064x}"
+
+
+def row_set_hash(rows):
+    """
+    Return an order-independent hash of a set of order rows.
+
+    Row digests are summed modulo 2**256, so the hash can also be built
+    incrementally while rows are streamed.
+    """
+    return _format_row_set_hash(sum(_row_digest(row) for row in rows))
+
+
+def _orders_table(connection):
+    """Return the table that physically stores order rows."""
+    return 'orders_compact' if is_normalized_schema(connection) else 'orders'
+
+
+def _record_ingest(connection, fingerprint, order_number, digest, row_count):
+    """Make fingerprint the only ledger entry for order_number."""
+    _ensure_ingest_ledger(connection)
+    connection.execute("DELETE FROM ingest_ledger WHERE OrderNumber = ?", (order_number,))
+    connection.execute(
+        "INSERT OR REPLACE INTO ingest_ledger (Fingerprint, OrderNumber, RowSetHash, RowCount) VALUES (?, ?, ?, ?)",
+        (fingerprint, order_number, digest, row_count)
+    )
+
+
+def _incomplete_rows(records):
+    """Return (row number, missing columns) for rows lacking a required key column."""
+    incomplete = []
+    for row_number, record in enumerate(records, start=1):
+        missing = [col for col in REQUIRED_ORDER_COLUMNS if _clean_value(record.get(col)) is None]
+        if missing:
+            incomplete.append((row_number, missing))
+    return incomplete
+
+
+def _replace_document_rows(connection, db_file, records, fingerprint):
+    """
+    Ingest a document's rows through the ledger in one transaction.
+
+    All rows must belong to one order. If the order already holds exactly
+    this row set, only the fingerprint is recorded. Otherwise all rows of the order are deleted and the new rows are
+    inserted with a single executemany().
+    """
+    if not records:
+        return 'unchanged'
+
+    incomplete = _incomplete_rows(records)
+    if incomplete:
+        details = "; ".join(f"row {row_number}: {', '.join(missing)}" for row_number, missing in incomplete[:10])
+        more = f" and {len(incomplete) - 10} more" if len(incomplete) > 10 else ""
+        raise ValueError(f"{len(incomplete)} rows are missing required values ({details}{more})")
+
+    order_numbers = sorted({str(record['OrderNumber']) for record in records})
+    if len(order_numbers) > 1:
+        raise ValueError(
+            f"Rows belong to {len(order_numbers)} orders ({', '.join(order_numbers)}); "
+            "a document can only replace one order"
+        )
+
+    order_number = records[0]['OrderNumber']
+    digest = row_set_hash(records)
+    upsert_sql, to_params, pending_ids = _order_writer(connection, db_file)
+
+    try:
+        _ensure_ingest_ledger(connection)
+        current = connection.execute(
+            "SELECT RowSetHash FROM ingest_ledger WHERE OrderNumber = ? ORDER BY ingested_at DESC LIMIT 1",
+            (order_number,)
+        ).fetchone()
+
+        if current is not None and current[0] == digest:
+            connection.execute(
+                "INSERT OR REPLACE INTO ingest_ledger (Fingerprint, OrderNumber, RowSetHash, RowCount) VALUES (?, ?, ?, ?)",
+                (fingerprint, order_number, digest, len(records))
+            )
+            connection.commit()
+            print(f"Order {order_number} is unchanged, skipped {len(records)} rows.")
+            return 'unchanged'
+
+        deleted = connection.execute(
+            f"DELETE FROM {_orders_table(connection)} WHERE OrderNumber = ?", (order_number,)
+        ).rowcount
+        connection.executemany(upsert_sql, [to_params(record) for record in records])
+        _record_ingest(connection, fingerprint, order_number, digest, len(records))
+        connection.commit()
+
+    except Exception:
+        connection.rollback()
+        raise
+
+    _publish_dimension_ids(pending_ids)
+    bump_table_version()
+    print(f"Wrote {len(records)} rows for order {order_number}, replacing {deleted}.")
+    return 'replaced' if deleted else 'inserted'
+
+
+def _replace_streamed_rows(connection, rows, ledger):
+    """
+    Pass rows through, deleting the order's existing rows before the first one
+    and accumulating the row set hash in ledger. Raises ValueError if the rows
+    belong to more than one order.
+    """
+    for row in rows:
+        if ledger['order_number'] is None:
+            ledger['order_number'] = row['OrderNumber']
+            connection.execute(
+                f"DELETE FROM {_orders_table(connection)} WHERE OrderNumber = ?", (row['OrderNumber'],)
+            )
+        elif row['OrderNumber'] != ledger['order_number']:
+            raise ValueError(
+                f"Rows belong to more than one order ({ledger['order_number']}, {row['OrderNumber']}); "
+                "a document can only replace one order"
+            )
+        ledger['digest'] += _row_digest(row)
+        yield row
+
+
+def is_normalized_schema(connection):
+    """Return True if orders is a view over the normalized orders_compact table."""
+    row = connection.execute(
+        "SELECT type FROM sqlite_master WHERE name = 'orders'"
+    ).fetchone()
+    return row is not None and row[0] == 'view'
+
+
+def _clean_value(value):
+    """Map pandas NaN to None so missing text is stored as NULL."""
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def _dimension_key_sql(columns, alias=None):
+    """
+    Return the expressions of a dictionary table's unique index.
+
+    NULL and '' are the same key, so lookups and joins must compare these
+    expressions rather than the raw columns.
+    """
+    prefix = f"{alias}." if alias else ""
+    return [f"IFNULL({prefix}{col}, '')" for col in columns]
+
+
+def _dimension_text(value):
+    """
+    Convert an attribute value to the text stored in its TEXT dictionary column.
+
+    pandas reads values such as a Season of 2025 as numbers. The IFNULL key
+    expressions have no type affinity, so lookups and cache keys must use text.
+    """
+    return None if value is None else str(value)
+
+
+def _dimension_id(connection, db_file, table, values, pending_ids):
+    """
+    Return the Id of a dictionary table row, creating it if needed.
+
+    Ids are cached per database and table, so repeated attribute values cost
+    no database round-trip. Ids looked up or created in the current
+    transaction go into pending_ids and only reach the shared cache once the
+    transaction has committed.
+    """
+    if all(value is None for value in values):
+        return None
+
+    key = (db_file, table)
+    committed = _dimension_id_cache.get(key, {})
+    if values in committed:
+        return committed[values]
+    pending = pending_ids.setdefault(key, {})
+    if values in pending:
+        return pending[values]
+
+    columns = DIMENSION_TABLES[table][1]
+    column_list = ", ".join(columns)
+    placeholders = ", ".join("?" for _ in columns)
+    match = " AND ".join(f"{expr} = IFNULL(?, '')" for expr in _dimension_key_sql(columns))
+
+    connection.execute(f"INSERT OR IGNORE INTO {table} ({column_list}) VALUES ({placeholders})", values)
+    dimension_id = connection.execute(f"SELECT Id FROM {table} WHERE {match}", values).fetchone()[0]
+    pending[values] = dimension_id
+    return dimension_id
+
+
+def _publish_dimension_ids(pending_ids):
+    """Add the dictionary ids of a committed transaction to the shared cache."""
+    for key, ids in pending_ids.items():
+        _dimension_id_cache.setdefault(key, {}).update(ids)
+
+
+def _order_writer(connection, db_file):
+    """
+    Return the UPSERT statement for the active schema, a function that turns
+    an orders row dict into its parameters, and the dictionary ids created
+    along the way. Pass those ids to _publish_dimension_ids() after commit.
+    """
+    pending_ids = {}
+    if not is_normalized_schema(connection):
+        return UPSERT_ORDER_SQL, dict, pending_ids
+
+    def to_params(row):
+        params = {col: _clean_value(value) for col, value in row.items()}
+        for table, (fk_column, columns) in DIMENSION_TABLES.items():
+            values = tuple(_dimension_text(params.get(col)) for col in columns)
+            params[fk_column] = _dimension_id(connection, db_file, table, values, pending_ids)
+        return params
+
+    return UPSERT_COMPACT_ORDER_SQL, to_params, pending_ids
+
+
+def migrate_to_normalized_schema(db_file):
+    """
+    Move the orders table into the normalized schema.
+
+    Repeated text attributes go into the styles, colors, fabrics and seasons
+    dictionary tables, the rows go into orders_compact with integer foreign
+    keys, and orders is recreated as a view with the original columns so
+    existing searches keep working. The migration runs in one transaction and
+    the file is vacuumed afterwards to reclaim the freed pages.
+
+    Parameters:
+    db_file (str): Path to the SQLite database file.
+    """
+    connection = sqlite3.connect(db_file, isolation_level=None)
+    try:
+        if is_normalized_schema(connection):
+            print("Database already uses the normalized schema.")
+            return
+
+        size_before = os.path.getsize(db_file)
+        connection.execute("BEGIN")
+
+        for table, (_, columns) in DIMENSION_TABLES.items():
+            column_defs = ", ".join(f"{col} TEXT" for col in columns)
+            unique_expr = ", ".join(_dimension_key_sql(columns))
+            column_list = ", ".join(columns)
+            not_all_null = " OR ".join(f"{col} IS NOT NULL" for col in columns)
+
+            connection.execute(f"CREATE TABLE {table} (Id INTEGER PRIMARY KEY AUTOINCREMENT, {column_defs})")
+            connection.execute(f"CREATE UNIQUE INDEX idx_{table}_values ON {table} ({unique_expr})")
+            connection.execute(f"""
+                INSERT OR IGNORE INTO {table} ({column_list})
+                SELECT DISTINCT {column_list} FROM orders WHERE {not_all_null}
+            """)
+
+        # Join each dictionary table on its unique key; all-NULL attributes stay NULL
+        joins = []
+        for table, alias in (('styles', 's'), ('colors', 'c'), ('fabrics', 'f'), ('seasons', 'se')):
+            columns = DIMENSION_TABLES[table][1]
+            key_match = " AND ".join(
+                f"{left} = {right}"
+                for left, right in zip(_dimension_key_sql(columns, alias), _dimension_key_sql(columns, 'o'))
+            )
+            not_all_null = " OR ".join(f"o.{col} IS NOT NULL" for col in columns)
+            joins.append(f"LEFT JOIN {table} {alias} ON {key_match} AND ({not_all_null})")
+
+        connection.execute(COMPACT_ORDERS_SCHEMA_SQL)
+        connection.execute(f"""
+            INSERT INTO orders_compact (
+                Id, OrderNumber, StyleCode, StyleId, ColorCode, ColorId,
+                Quantity, Price, Total, FabricId,
+                SizeXS, SizeS, SizeM, SizeL, SizeXL, SizeXXL,
+                IssueDate, PickupDate, OwnershipDate, SeasonId, Line, created_at
+            )
+            SELECT
+                o.Id, o.OrderNumber, o.StyleCode, s.Id, o.ColorCode, c.Id,
+                o.Quantity, o.Price, o.Total, f.Id,
+                o.SizeXS, o.SizeS, o.SizeM, o.SizeL, o.SizeXL, o.SizeXXL,
+                o.IssueDate, o.PickupDate, o.OwnershipDate, se.Id, o.Line, o.created_at
+            FROM orders o
+            {" ".join(joins)}
+        """)
+
+        connection.execute("DROP TABLE orders")
+        connection.execute(ORDERS_VIEW_SQL)
+        connection.execute("COMMIT")
+
+        connection.execute("VACUUM")
+        _dimension_id_cache.clear()
+        bump_table_version()
+
+        size_after = os.path.getsize(db_file)
+        print(f"Migrated {db_file} to the normalized schema: {size_before:,} -> {size_after:,} bytes")
+
+    except sqlite3.Error:
+        if connection.in_transaction:
+            connection.execute("ROLLBACK")
+        raise
+
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    import sys
+    migrate_to_normalized_schema(sys.argv[1] if len(sys.argv) > 1 else "garment_orders.db")
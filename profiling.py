@@ -0,0 +1,111 @@
+import cProfile
+import functools
+import os
+import pstats
+import threading
+import time
+from datetime import datetime
+
+# Set PO_PROFILE=1 to profile every Streamlit rerun
+PROFILE_ENV_VAR = "PO_PROFILE"
+PROFILE_DIR = os.environ.get("PO_PROFILE_DIR", "profiles")
+PROFILE_TOP_N = int(os.environ.get("PO_PROFILE_TOP_N", "20"))
+
+# Streamlit runs each session's reruns in its own thread, so the timings of
+# @profiled functions during the current rerun are kept per thread
+_rerun_state = threading.local()
+
+
+def _function_timings():
+    """Return the timing list of the rerun running in this thread."""
+    if not hasattr(_rerun_state, 'function_timings'):
+        _rerun_state.function_timings = []
+    return _rerun_state.function_timings
+
+
+def profiling_enabled():
+    """Return True if profiling was switched on through the environment."""
+    return os.environ.get(PROFILE_ENV_VAR, "").lower() in ("1", "true", "yes", "on")
+
+
+def profiled(func):
+    """
+    Record the wall-clock time of each call to func during a profiled rerun.
+
+    When profiling is disabled the function is returned unchanged, so the
+    decorator costs nothing in normal use.
+    """
+    if not profiling_enabled():
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _function_timings().append({
+                'Function': func.__qualname__,
+                'Time (ms)': (time.perf_counter() - started) * 1000,
+            })
+
+    return wrapper
+
+
+def _hotspots(stats, top_n):
+    """Return the top_n functions by self time as a list of row dicts."""
+    rows = []
+    for (file_name, line, func_name), (_, calls, self_time, cum_time, _) in stats.stats.items():
+        rows.append({
+            'Function': func_name,
+            'Location': f"{os.path.basename(file_name)}:{line}",
+            'Calls': calls,
+            'Self (ms)': self_time * 1000,
+            'Cumulative (ms)': cum_time * 1000,
+        })
+    rows.sort(key=lambda row: row['Self (ms)'], reverse=True)
+    return rows[:top_n]
+
+
+def profile_rerun(func, *args, **kwargs):
+    """
+    Run one Streamlit rerun under cProfile and save its profile.
+
+    Each rerun is dumped as a pstats file (usable with snakeviz, flameprof or
+    gprof2dot) and its latency is appended to rerun_latency.csv in PROFILE_DIR.
+
+    Parameters:
+    func (callable): The rerun entry point, normally main().
+
+    Returns:
+    dict: Rerun latency, profile path, top-N hotspots and @profiled timings.
+    """
+    _rerun_state.function_timings = []
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    profile_path = os.path.join(PROFILE_DIR, f"rerun_{timestamp}.prof")
+    profiler.dump_stats(profile_path)
+
+    latency_log = os.path.join(PROFILE_DIR, "rerun_latency.csv")
+    write_header = not os.path.exists(latency_log)
+    with open(latency_log, 'a', encoding='utf-8') as log:
+        if write_header:
+            log.write("timestamp,rerun_ms,profile\n")
+        log.write(f"{timestamp},{elapsed_ms:.1f},{os.path.basename(profile_path)}\n")
+
+    return {
+        'rerun_ms': elapsed_ms,
+        'profile_path': profile_path,
+        'hotspots': _hotspots(pstats.Stats(profiler), PROFILE_TOP_N),
+        'function_timings': list(_function_timings()),
+    }
@@ -5,9 +5,13 @@ from pathlib import Path
 import pandas as pd
 import shutil
 from datetime import datetime, timedelta
-import sqlite3
 from llama_parse import LlamaParse
-from database_utils import insert_csv_to_db
+from database_utils import (
+    insert_csv_to_db, insert_rows_to_db, cached_read_sql, get_query_cache_stats,
+    document_fingerprint, find_ingested_document
+)
+from chunked_processing import DEFAULT_PAGES_PER_CHUNK, write_sorted_run, iter_merged_runs
+from profiling import profiled, profiling_enabled, profile_rerun
 import streamlit as st
 import tempfile
 import json
@@ -21,23 +25,6 @@ st.set_page_config(
     layout="wide"
 )
 
-# Custom CSS for elegant styling
-st.markdown("""
-    <style>
-        .stButton > button {
-            width: 100%;
-            border-radius: 5px;
-            height: 3em;
-        }
-        .st-emotion-cache-1v0mbdj {
-            width: 100%;
-        }
-        .dataframe {
-            font-size: 12px;
-        }
-    </style>
-""", unsafe_allow_html=True)
-
 # Initialize session state
 if 'processed_df' not in st.session_state:
     st.session_state.processed_df = None
@@ -45,7 +32,22 @@ if 'processed_df' not in st.session_state:
 # Set API key
 os.environ["LLAMA_CLOUD_API_KEY"] = "llx-svCPu1UniVECsxWEeQINhixGgBZgSHjr4OcIp0o1VX57JMsm"
 
+PO_PARSING_INSTRUCTION = """
+            This document is a Garment Purchase Order (PO), issued by the buyer to the garment supplier, specifying essential order details such as style, quantity, size breakdown, color, price, delivery date, and payment terms also Total amount. It serves as a contract between the buyer and supplier.
+
+            Extract and consolidate the required data with out any Notes: details. If any value for a required column is missing, check subsequent pages to ensure completeness.
+
+            Required columns:
+                expected_columns = [
+                    'Line', 'StyleCode', 'Description', 'ColorCode', 'ColorName', 'Quantity',
+                    'Price', 'Total', 'Fabric', 'Composition', 'SizeXS', 'SizeS', 'SizeM',
+                    'SizeL', 'SizeXL', 'SizeXXL', 'IssueDate', 'PickupDate', 'OwnershipDate',
+                    'Season', 'OrderNumber'
+                ]
+            """
+
 # Original functions from po_pdf.py
+@profiled
 def save_pages_to_files(documents_with_instruction, base_filename="po_", output_dir="output"):
     os.makedirs(output_dir, exist_ok=True)
     
@@ -100,6 +102,7 @@ def save_pages_to_files(documents_with_instruction, base_filename="po_", output_
 #             st.error(f"Error processing {md_file}: {str(e)}")
 #             st.write(f"Detailed error: {traceback.format_exc()}")
 
+@profiled
 def convert_md_to_df(input_folder, output_folder):
     """
     Convert markdown files from input folder to pandas DataFrames and save them as CSV files
@@ -186,6 +189,7 @@ def convert_md_to_df(input_folder, output_folder):
             print(traceback.format_exc())
 
 
+@profiled
 def merge_csv_files(input_file, output_file):
     """
     Merge all CSV files in the input folder into a single DataFrame and save it as a CSV file.
@@ -314,6 +318,15 @@ def empty_folders(*folder_paths):
         else:
             st.warning(f"Folder does not exist: {folder_path}")
 
+@profiled
+def parse_pdf(pdf_path):
+    """Parse a PO PDF with LlamaParse and return one Document per page"""
+    return LlamaParse(
+        result_type="markdown",
+        parsing_instruction=PO_PARSING_INSTRUCTION
+    ).load_data(pdf_path)
+
+@profiled
 def process_uploaded_file(uploaded_file, input_folder, output_folder, merged_folder):
     """Process the uploaded PDF file"""
     if uploaded_file is None:
@@ -326,22 +339,7 @@ def process_uploaded_file(uploaded_file, input_folder, output_folder, merged_fol
 
     with st.spinner("Processing PDF..."):
         # Parse PDF
-        documents_with_instruction = LlamaParse(
-            result_type="markdown",
-            parsing_instruction="""
-            This document is a Garment Purchase Order (PO), issued by the buyer to the garment supplier, specifying essential order details such as style, quantity, size breakdown, color, price, delivery date, and payment terms also Total amount. It serves as a contract between the buyer and supplier.
-
-            Extract and consolidate the required data with out any Notes: details. If any value for a required column is missing, check subsequent pages to ensure completeness.
-
-            Required columns:
-                expected_columns = [
-                    'Line', 'StyleCode', 'Description', 'ColorCode', 'ColorName', 'Quantity',
-                    'Price', 'Total', 'Fabric', 'Composition', 'SizeXS', 'SizeS', 'SizeM',
-                    'SizeL', 'SizeXL', 'SizeXXL', 'IssueDate', 'PickupDate', 'OwnershipDate',
-                    'Season', 'OrderNumber'
-                ]
-            """
-        ).load_data(temp_pdf_path)
+        documents_with_instruction = parse_pdf(temp_pdf_path)
 
         # Save pages
         save_pages_to_files(documents_with_instruction, base_filename="po_", output_dir=input_folder)
@@ -358,6 +356,90 @@ def process_uploaded_file(uploaded_file, input_folder, output_folder, merged_fol
 
         return merged_df
 
+@profiled
+def process_uploaded_file_chunked(uploaded_file, work_dir, db_file, pages_per_chunk=DEFAULT_PAGES_PER_CHUNK,
+                                  fingerprint=None):
+    """
+    Process a large PO PDF in bounded page windows and stream it into the database.
+
+    Parsed pages are spilled to disk straight away, each window of pages is
+    converted and sorted into a run file, and the runs are k-way merged by Line
+    and written to the database without ever building the full DataFrame.
+
+    Parameters:
+    uploaded_file: The uploaded PDF file
+    work_dir (str): Scratch folder for pages, page CSVs and sorted runs
+    db_file (str): Path to the SQLite database file
+    pages_per_chunk (int): Number of pages converted and sorted together
+    fingerprint (str): Document fingerprint recorded in the ingest ledger
+
+    Returns:
+    dict: Summary statistics of the rows written
+    """
+    if uploaded_file is None:
+        return None
+
+    pages_folder = os.path.join(work_dir, "pages")
+    runs_folder = os.path.join(work_dir, "runs")
+    os.makedirs(pages_folder, exist_ok=True)
+    os.makedirs(runs_folder, exist_ok=True)
+
+    temp_pdf_path = os.path.join(work_dir, "uploaded_po.pdf")
+    with open(temp_pdf_path, "wb") as f:
+        f.write(uploaded_file.getvalue())
+
+    with st.spinner("Processing PDF in chunked mode..."):
+        # Spill every parsed page to disk and drop the in-memory documents
+        documents_with_instruction = parse_pdf(temp_pdf_path)
+        page_count = len(documents_with_instruction)
+        save_pages_to_files(documents_with_instruction, base_filename="po_", output_dir=pages_folder)
+        del documents_with_instruction
+
+        # Convert and sort each window of pages into its own run file
+        run_paths = []
+        for start in range(0, page_count, pages_per_chunk):
+            chunk_in = os.path.join(work_dir, "chunk_md")
+            chunk_out = os.path.join(work_dir, "chunk_csv")
+            os.makedirs(chunk_in, exist_ok=True)
+            os.makedirs(chunk_out, exist_ok=True)
+
+            for page_num in range(start, min(start + pages_per_chunk, page_count)):
+                page_file = f"po_{page_num + 1}.md"
+                page_path = os.path.join(pages_folder, page_file)
+                if os.path.exists(page_path):
+                    shutil.move(page_path, os.path.join(chunk_in, page_file))
+
+            convert_md_to_df(chunk_in, chunk_out)
+            csv_paths = [os.path.join(chunk_out, f) for f in os.listdir(chunk_out) if f.endswith('.csv')]
+
+            run_path = os.path.join(runs_folder, f"run_{len(run_paths) + 1}.csv")
+            if write_sorted_run(csv_paths, run_path):
+                run_paths.append(run_path)
+
+            shutil.rmtree(chunk_in)
+            shutil.rmtree(chunk_out)
+
+        if not run_paths:
+            raise ValueError("No rows found in the uploaded PDF")
+
+        # Merge the runs by Line and stream them into the database
+        summary = {'rows': 0, 'styles': set(), 'quantity': 0.0, 'total': 0.0}
+
+        def tally(rows):
+            for row in rows:
+                summary['rows'] += 1
+                summary['styles'].add(row['StyleCode'])
+                summary['quantity'] += float(row['Quantity'] or 0)
+                summary['total'] += float(row['Total'] or 0)
+                yield row
+
+        insert_rows_to_db(db_file, tally(iter_merged_runs(run_paths)), fingerprint=fingerprint)
+
+    summary['styles'] = len(summary['styles'])
+    summary['pages'] = page_count
+    summary['runs'] = len(run_paths)
+    return summary
+
 # def main():
 #     st.title("📋 PO Processing System")
 #     st.write("Upload a PO PDF file to process and manage the data")
@@ -449,7 +531,27 @@ def process_uploaded_file(uploaded_file, input_folder, output_folder, merged_fol
 #             shutil.rmtree(temp_dir)
             
 
+@profiled
+def inject_custom_css():
+    """Custom CSS for elegant styling"""
+    st.markdown("""
+        <style>
+            .stButton > button {
+                width: 100%;
+                border-radius: 5px;
+                height: 3em;
+            }
+            .st-emotion-cache-1v0mbdj {
+                width: 100%;
+            }
+            .dataframe {
+                font-size: 12px;
+            }
+        </style>
+    """, unsafe_allow_html=True)
+
 def main():
+    inject_custom_css()
     st.title("📋 PO Processing System")
     st.write("Upload a PO PDF file to process and manage the data")
 
@@ -463,11 +565,18 @@ def main():
 
     # File uploader
     uploaded_file = st.file_uploader("Choose a PDF file", type=['pdf'])
+    chunked_mode = st.checkbox(
+        "Large document mode",
+        help="Process pages in bounded chunks and save straight to the database, skipping the editor"
+    )
 
     # Reset session state when a new file is uploaded
     if uploaded_file and uploaded_file != st.session_state['uploaded_file']:
         st.session_state['uploaded_file'] = uploaded_file
         st.session_state['processed_df'] = None
+        st.session_state['chunked_summary'] = None
+        st.session_state['fingerprint'] = document_fingerprint(uploaded_file.getvalue())
+        st.session_state['ingested_entry'] = find_ingested_document(db_file, st.session_state['fingerprint'])
 
     # Enhanced Search Section
     st.subheader("🔍 Search Orders")
@@ -482,17 +591,16 @@ def main():
             
         if quick_search and search_term:
             try:
-                with sqlite3.connect(db_file) as conn:
-                    query = """
-                    SELECT * FROM orders
-                    WHERE OrderNumber LIKE ?
-                    OR StyleCode LIKE ?
-                    OR ColorName LIKE ?
-                    """
-                    search_pattern = f"%{search_term}%"
-                    params = (search_pattern, search_pattern, search_pattern)
-                    results = pd.read_sql_query(query, conn, params=params)
-                    display_search_results(results)
+                query = """
+                SELECT * FROM orders
+                WHERE OrderNumber LIKE ?
+                OR StyleCode LIKE ?
+                OR ColorName LIKE ?
+                """
+                search_pattern = f"%{search_term}%"
+                params = (search_pattern, search_pattern, search_pattern)
+                results = cached_read_sql(db_file, query, params)
+                display_search_results(results)
             except Exception as e:
                 st.error(f"Search error: {str(e)}")
 
@@ -526,47 +634,93 @@ def main():
             
         if advanced_search:
             try:
-                with sqlite3.connect(db_file) as conn:
-                    conditions = []
-                    params = []
-                    
-                    if order_number:
-                        conditions.append("OrderNumber LIKE ?")
-                        params.append(f"%{order_number}%")
-                    
-                    if style_code:
-                        conditions.append("StyleCode LIKE ?")
-                        params.append(f"%{style_code}%")
-                    
-                    if color_name:
-                        conditions.append("ColorName LIKE ?")
-                        params.append(f"%{color_name}%")
-                    
-                    if min_quantity > 0:
-                        conditions.append("Quantity >= ?")
-                        params.append(min_quantity)
-                    
-                    if len(date_range) == 2:
-                        conditions.append("IssueDate BETWEEN ? AND ?")
-                        params.extend([date_range[0], date_range[1]])
-                    
-                    where_clause = " AND ".join(conditions) if conditions else "1=1"
-                    order_direction = "DESC" if sort_order == "Descending" else "ASC"
-                    
-                    query = f"""
-                    SELECT * FROM orders
-                    WHERE {where_clause}
-                    ORDER BY {sort_by} {order_direction}
-                    """
-                    
-                    results = pd.read_sql_query(query, conn, params=params)
-                    display_search_results(results)
-                    
+                conditions = []
+                params = []
+                
+                if order_number:
+                    conditions.append("OrderNumber LIKE ?")
+                    params.append(f"%{order_number}%")
+                
+                if style_code:
+                    conditions.append("StyleCode LIKE ?")
+                    params.append(f"%{style_code}%")
+                
+                if color_name:
+                    conditions.append("ColorName LIKE ?")
+                    params.append(f"%{color_name}%")
+                
+                if min_quantity > 0:
+                    conditions.append("Quantity >= ?")
+                    params.append(min_quantity)
+                
+                if len(date_range) == 2:
+                    conditions.append("IssueDate BETWEEN ? AND ?")
+                    params.extend([date_range[0], date_range[1]])
+                
+                where_clause = " AND ".join(conditions) if conditions else "1=1"
+                order_direction = "DESC" if sort_order == "Descending" else "ASC"
+                
+                query = f"""
+                SELECT * FROM orders
+                WHERE {where_clause}
+                ORDER BY {sort_by} {order_direction}
+                """
+                
+                results = cached_read_sql(db_file, query, params)
+                display_search_results(results)
+                
             except Exception as e:
                 st.error(f"Advanced search error: {str(e)}")
 
+    # Search cache statistics
+    cache_stats = get_query_cache_stats()
+    st.caption(
+        f"Search cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+        f"({cache_stats['hit_rate']:.0%} hit rate), {cache_stats['entries']} cached queries"
+    )
+
+    # Skip documents already recorded in the ingest ledger
+    ingested_entry = st.session_state.get('ingested_entry')
+    if uploaded_file is not None and ingested_entry is not None:
+        st.info(
+            f"This document was already saved on {ingested_entry['ingested_at']} as order "
+            f"{ingested_entry['OrderNumber']} ({ingested_entry['RowCount']} rows). Skipping processing."
+        )
+        if st.button("Process Again"):
+            st.session_state['ingested_entry'] = None
+            st.rerun()
+
+    # Chunked File Processing Section
+    elif uploaded_file is not None and chunked_mode:
+        temp_dir = tempfile.mkdtemp()
+        try:
+            if st.session_state.get('chunked_summary') is None:
+                st.session_state['chunked_summary'] = process_uploaded_file_chunked(
+                    uploaded_file, temp_dir, db_file, fingerprint=st.session_state['fingerprint']
+                )
+
+            summary = st.session_state['chunked_summary']
+            st.success(
+                f"Saved {summary['rows']:,} rows from {summary['pages']} pages "
+                f"({summary['runs']} sorted runs) to the database!"
+            )
+
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Total Styles", summary['styles'])
+            with col2:
+                st.metric("Total Quantity", f"{summary['quantity']:,.0f}")
+            with col3:
+                st.metric("Total Value", f"${summary['total']:,.2f}")
+
+        except Exception as e:
+            st.error(f"An error occurred: {str(e)}")
+
+        finally:
+            shutil.rmtree(temp_dir)
+
     # File Processing Section
-    if uploaded_file is not None:
+    elif uploaded_file is not None:
         # Create temporary directories
         temp_dir = tempfile.mkdtemp()
         input_folder = os.path.join(temp_dir, "output")
@@ -615,9 +769,14 @@ def main():
                             temp_csv = os.path.join(merged_folder, "edited_po.csv")
                             edited_df.to_csv(temp_csv, index=False)
 
-                            # Insert into database
-                            insert_csv_to_db(db_file, temp_csv)
-                            st.success("Data successfully saved to database!")
+                            # Replace the order's rows in the database
+                            status = insert_csv_to_db(db_file, temp_csv, fingerprint=st.session_state['fingerprint'])
+                            if status is None:
+                                st.error("Error saving to database: the edited data file was not found.")
+                            elif status == 'unchanged':
+                                st.info("Order is already up to date in the database.")
+                            else:
+                                st.success("Data successfully saved to database!")
                         except Exception as e:
                             st.error(f"Error saving to database: {str(e)}")
 
@@ -639,6 +798,7 @@ def main():
             # Cleanup temporary directories
             shutil.rmtree(temp_dir)
 
+@profiled
 def display_search_results(results):
     """Display search results with statistics and export options"""
     if not results.empty:
@@ -697,6 +857,32 @@ def display_search_results(results):
     else:
         st.info("No results found matching your search criteria.")
 
+def display_profile_report(report):
+    """Display rerun latency, pipeline timings and the top cProfile hotspots"""
+    with st.expander(f"⏱️ Rerun profile: {report['rerun_ms']:,.0f} ms"):
+        st.caption(f"Profile saved to {report['profile_path']}")
+        if report['function_timings']:
+            st.subheader("Pipeline functions")
+            st.dataframe(
+                report['function_timings'],
+                use_container_width=True,
+                column_config={
+                    "Time (ms)": st.column_config.NumberColumn("Time (ms)", format="%.1f")
+                }
+            )
+        st.subheader("Top hotspots")
+        st.dataframe(
+            report['hotspots'],
+            use_container_width=True,
+            column_config={
+                "Self (ms)": st.column_config.NumberColumn("Self (ms)", format="%.1f"),
+                "Cumulative (ms)": st.column_config.NumberColumn("Cumulative (ms)", format="%.1f")
+            }
+        )
+
 if __name__ == "__main__":
-    main()
+    if profiling_enabled():
+        display_profile_report(profile_rerun(main))
+    else:
+        main()
 